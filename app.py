@@ -5,19 +5,57 @@ Flask 웹 대시보드 서버
 """
 
 import os
-import json
+import re
 import sys
 import uuid
+import queue
+import time
+import atexit
+import hashlib
+import heapq
 import smtplib
-import datetime
 import threading
 import subprocess
 from pathlib import Path
-from flask import Flask, render_template, request, jsonify
+from concurrent.futures import ThreadPoolExecutor
+
+import orjson
+from flask import Flask, Response, abort, jsonify, make_response, render_template, request, send_file
+from flask.json.provider import JSONProvider
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 
+
+class OrjsonProvider(JSONProvider):
+    """jsonify / request.json 을 orjson으로 처리 (compact / sort_keys는 app.json에서 설정)"""
+
+    def _option(self) -> int:
+        option = orjson.OPT_NON_STR_KEYS
+        if not self.compact:
+            option |= orjson.OPT_INDENT_2
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return option
+
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj, option=self._option()).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, option=self._option()),
+            mimetype="application/json",
+        )
+
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
+# 디버그 모드에서도 들여쓰기·키 정렬 없이 응답
+app.json.compact = True
+app.json.sort_keys = False
 
 # ─────────────────────────────────────────────
 # 경로 설정
@@ -35,10 +73,118 @@ REPORTS_DIR.mkdir(exist_ok=True)
 # ─────────────────────────────────────────────
 # 설정 관리
 # ─────────────────────────────────────────────
-def load_config() -> dict:
-    if CONFIG_FILE.exists():
-        with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
+FLUSH_DELAY = 0.5        # 유저 목록 변경을 모아서 디스크에 기록하는 간격(초)
+
+
+def _atomic_write_json(path: Path, obj):
+    """임시 파일에 쓴 뒤 os.replace로 교체 (중간에 죽어도 잘린 파일이 남지 않음)"""
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_bytes(orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+    os.replace(tmp, path)
+
+
+class _JsonCache:
+    """JSON 파일 파싱 결과를 mtime 기준으로 캐시 (파일이 바뀔 때만 다시 읽음)"""
+
+    def __init__(self, path: Path, default):
+        self.path = path
+        self.default = default
+        self.mtime_ns = None
+        self.value = None
+        self.dirty = False
+        self.lock = threading.RLock()
+        self._timer = None
+
+    def get(self):
+        with self.lock:
+            # 아직 기록되지 않은 변경이 있으면 메모리 값이 기준
+            if self.dirty:
+                return self.value
+            # 존재 확인과 mtime 조회를 stat 한 번으로 처리
+            try:
+                mtime_ns = self.path.stat().st_mtime_ns
+            except FileNotFoundError:
+                mtime_ns = None
+            if self.value is None or mtime_ns != self.mtime_ns:
+                self.value = orjson.loads(self.path.read_bytes()) if mtime_ns is not None else self.default()
+                self.mtime_ns = mtime_ns
+                self._on_reload()
+            return self.value
+
+    def _on_reload(self):
+        pass
+
+    def store(self, value):
+        with self.lock:
+            _atomic_write_json(self.path, value)
+            self.value = value
+            self.mtime_ns = self.path.stat().st_mtime_ns
+            self.dirty = False
+
+    def store_later(self, value):
+        """메모리 값만 바꾸고 디스크 기록은 FLUSH_DELAY 후 한 번에 처리"""
+        with self.lock:
+            self.value = value
+            self.dirty = True
+            if self._timer is None:
+                self._timer = threading.Timer(FLUSH_DELAY, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        with self.lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self.dirty:
+                return
+            _atomic_write_json(self.path, self.value)
+            self.mtime_ns = self.path.stat().st_mtime_ns
+            self.dirty = False
+
+
+class _UsersCache(_JsonCache):
+    """유저 목록 + 이름/ID 인덱스 (다시 읽을 때 재구성, 핸들러에서 증분 갱신)"""
+
+    def __init__(self, path: Path):
+        super().__init__(path, list)
+        self.by_name: dict[str, dict] = {}
+        self.by_id: dict[str, dict] = {}
+        self.serialized = None   # /api/users 응답용 JSON bytes (변경 시 무효화)
+
+    def _on_reload(self):
+        by_name, by_id = {}, {}
+        for u in self.value:
+            by_name.setdefault(u["name"], u)
+            by_id.setdefault(u["id"], u)
+        self.by_name, self.by_id = by_name, by_id
+        self.serialized = None
+
+    def store(self, value):
+        with self.lock:
+            super().store(value)
+            self.serialized = None
+
+    def store_later(self, value):
+        with self.lock:
+            super().store_later(value)
+            self.serialized = None
+
+    def json_payload(self) -> tuple[bytes, str]:
+        """(JSON bytes, ETag) — 유저 목록이 바뀔 때만 다시 만듦"""
+        with self.lock:
+            self.get()
+            if self.serialized is None:
+                body = orjson.dumps(self.value)
+                self.serialized = (body, hashlib.blake2b(body, digest_size=8).hexdigest())
+            return self.serialized
+
+
+def _now_str() -> str:
+    return time.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _default_config() -> dict:
     return {
         "gemini_api_key": os.environ.get("GEMINI_API_KEY", ""),
         "gmail_user": "",
@@ -49,81 +195,179 @@ def load_config() -> dict:
     }
 
 
+_CFG = _JsonCache(CONFIG_FILE, _default_config)
+_WL = _JsonCache(WATCHLIST_FILE, lambda: {"stocks": [], "industries": []})
+_USERS = _UsersCache(USERS_FILE)
+
+
+def load_config() -> dict:
+    return _CFG.get()
+
+
 def save_config(config: dict):
-    with open(CONFIG_FILE, "w", encoding="utf-8") as f:
-        json.dump(config, f, ensure_ascii=False, indent=2)
+    _CFG.store(config)
 
 
 def load_watchlist() -> dict:
-    if WATCHLIST_FILE.exists():
-        with open(WATCHLIST_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {"stocks": [], "industries": []}
+    return _WL.get()
 
 
 def save_watchlist(watchlist: dict):
-    with open(WATCHLIST_FILE, "w", encoding="utf-8") as f:
-        json.dump(watchlist, f, ensure_ascii=False, indent=2)
+    _WL.store(watchlist)
 
 
 def load_users() -> list:
-    if USERS_FILE.exists():
-        with open(USERS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return []
+    return _USERS.get()
 
 
 def save_users(users: list):
-    with open(USERS_FILE, "w", encoding="utf-8") as f:
-        json.dump(users, f, ensure_ascii=False, indent=2)
+    _USERS.store_later(users)
+
+
+# 종료 시 아직 기록되지 않은 유저 변경사항 저장
+atexit.register(_USERS.flush)
+
+
+# ─────────────────────────────────────────────
+# 백그라운드 작업 (오래 걸리는 요청은 job_id만 먼저 반환)
+# ─────────────────────────────────────────────
+JOB_TIMEOUT = 120        # 진행 상황 스트림 최대 대기 시간(초)
+JOB_HEARTBEAT = 15       # SSE 연결 유지용 heartbeat 간격(초)
+
+_jobs: dict[str, queue.Queue] = {}
+_jobs_finished: dict[str, float] = {}   # job_id → 완료 시각 (스트림을 아무도 열지 않은 작업 정리용)
+_jobs_lock = threading.Lock()
+
+
+def _run_job(jid: str, q: queue.Queue, fn, args: tuple):
+    try:
+        result = fn(*args, lambda message: q.put({"done": False, "message": message}))
+    except Exception as e:
+        result = {"success": False, "message": f"오류: {e}"}
+    q.put({"done": True, **result})
+    with _jobs_lock:
+        if jid in _jobs:
+            _jobs_finished[jid] = time.monotonic()
+
+
+def _evict_finished_jobs():
+    """완료 후 JOB_TIMEOUT이 지나도록 스트림이 열리지 않은 작업 제거 (_jobs_lock 안에서 호출)"""
+    cutoff = time.monotonic() - JOB_TIMEOUT
+    for jid in [jid for jid, finished in _jobs_finished.items() if finished < cutoff]:
+        del _jobs_finished[jid]
+        _jobs.pop(jid, None)
+
+
+def _start_job(fn, *args) -> str:
+    """fn(*args, progress)를 데몬 스레드에서 실행하고 job_id 반환"""
+    jid = str(uuid.uuid4())
+    q = queue.Queue()
+    with _jobs_lock:
+        _evict_finished_jobs()
+        _jobs[jid] = q
+    threading.Thread(target=_run_job, args=(jid, q, fn, args), daemon=True).start()
+    return jid
 
 
 # ─────────────────────────────────────────────
 # 라우트: 메인 페이지
 # ─────────────────────────────────────────────
+# 리포트 파일명: YYYYMMDD_HHMMSS_유형_대상.md (scheduler.save_report)
+_REPORT_RE = re.compile(r"^(\d{4})(\d{2})(\d{2})_(\d{2})(\d{2})\d*_(.+)\.md$")
+
+# 최근 리포트 목록 캐시 (reports 디렉토리 mtime이나 limit이 바뀔 때만 다시 스캔)
+_reports_cache = {"key": None, "list": []}
+
+
+def recent_reports(limit: int = 10) -> list:
+    key = (REPORTS_DIR.stat().st_mtime_ns, limit)
+    if key == _reports_cache["key"]:
+        return _reports_cache["list"]
+
+    with os.scandir(REPORTS_DIR) as it:
+        names = [e.name for e in it if e.name.endswith(".md") and e.is_file()]
+
+    report_list = []
+    for filename in heapq.nlargest(limit, names):
+        m = _REPORT_RE.match(filename)
+        if m:
+            Y, M, D, h, mn, name = m.groups()
+            report_list.append({"filename": filename, "date": f"{Y}-{M}-{D} {h}:{mn}", "name": name})
+
+    _reports_cache["list"] = report_list
+    _reports_cache["key"] = key
+    return report_list
+
+
+def _conditional(resp: Response, etag: str) -> Response:
+    """약한 ETag를 붙이고, 브라우저 캐시와 같으면 304로 응답"""
+    resp.set_etag(etag, weak=True)
+    resp.cache_control.no_cache = True
+    return resp.make_conditional(request)
+
+
 @app.route("/")
 def index():
     config = load_config()
     watchlist = load_watchlist()
-    reports = sorted(REPORTS_DIR.glob("*.md"), reverse=True)[:10]
-    
-    report_list = []
-    for r in reports:
-        parts = r.stem.split("_", 2)
-        if len(parts) >= 3:
-            d, t, name = parts
-            date_str = f"{d[:4]}-{d[4:6]}-{d[6:]} {t[:2]}:{t[2:4]}"
-            report_list.append({"filename": r.name, "date": date_str, "name": name})
-    
-    return render_template("index.html",
+    body = render_template("index.html",
                          config=config,
                          watchlist=watchlist,
-                         reports=report_list)
+                         reports=recent_reports())
+    etag = hashlib.blake2b(body.encode("utf-8"), digest_size=8).hexdigest()
+    return _conditional(make_response(body), etag)
 
 
 # ─────────────────────────────────────────────
 # API: 설정 저장
 # ─────────────────────────────────────────────
+def _as_str(v) -> str:
+    return str(v).strip()
+
+
+def _as_list(v) -> list:
+    """종목/산업 목록 — 문자열 하나는 한 항목으로 감싸고, 리스트가 아니거나 문자열 외 항목이 있으면 거부"""
+    if isinstance(v, str):
+        v = [v]
+    if not isinstance(v, list):
+        raise TypeError("목록 형식이 아닙니다")
+    items = [item for item in v if item is not None]
+    if not all(isinstance(item, str) for item in items):
+        raise TypeError("목록 항목은 문자열이어야 합니다")
+    return [item for item in map(str.strip, items) if item]
+
+
+# (키, 변환 함수) — api_save_config에서 허용하는 설정 필드
+_CONFIG_FIELDS = (
+    ("gemini_api_key",     _as_str),
+    ("gmail_user",         _as_str),
+    # Google 앱 비밀번호는 "xxxx xxxx xxxx xxxx" 형식으로 표시되므로 공백 제거
+    ("gmail_app_password", lambda v: str(v).replace(" ", "").strip()),
+    ("email_recipient",    _as_str),
+    ("schedule_hour",      int),
+    ("schedule_minute",    int),
+)
+
+# (키, 변환 함수, 기본값) — api_register_user에서 저장하는 유저 설정 필드
+_USER_FIELDS = (
+    ("stocks",          _as_list, []),
+    ("industries",      _as_list, []),
+    ("schedule_hour",   int,  9),
+    ("schedule_minute", int,  0),
+)
+
+
 @app.route("/api/save_config", methods=["POST"])
 def api_save_config():
     data = request.json
-    config = load_config()
-
-    if "gemini_api_key" in data:
-        config["gemini_api_key"] = data["gemini_api_key"].strip()
-    if "gmail_user" in data:
-        config["gmail_user"] = data["gmail_user"].strip()
-    if "gmail_app_password" in data:
-        # Google 앱 비밀번호는 "xxxx xxxx xxxx xxxx" 형식으로 표시되므로 공백 제거
-        config["gmail_app_password"] = data["gmail_app_password"].replace(" ", "").strip()
-    if "email_recipient" in data:
-        config["email_recipient"] = data["email_recipient"].strip()
-    if "schedule_hour" in data:
-        config["schedule_hour"] = int(data["schedule_hour"])
-    if "schedule_minute" in data:
-        config["schedule_minute"] = int(data["schedule_minute"])
-
-    save_config(config)
+    # 변환을 모두 마친 뒤 반영 (중간에 실패해도 캐시된 설정이 반쯤 바뀌지 않도록)
+    try:
+        updates = {key: coerce(data[key]) for key, coerce in _CONFIG_FIELDS
+                   if data.get(key) is not None}
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "message": "설정 값 형식이 올바르지 않습니다."})
+    # 캐시된 dict를 직접 바꾸지 않고 새 dict로 저장 (기록 실패 시 메모리 설정도 그대로)
+    save_config({**load_config(), **updates})
     return jsonify({"success": True, "message": "설정이 저장되었습니다."})
 
 
@@ -144,6 +388,58 @@ def api_save_watchlist():
 # ─────────────────────────────────────────────
 # API: Gmail 테스트 전송
 # ─────────────────────────────────────────────
+_TEST_EMAIL_HTML = """<div style="font-family:'Malgun Gothic',sans-serif;max-width:500px;margin:0 auto;padding:24px;">
+  <div style="background:linear-gradient(135deg,#1a73e8,#0b3d91);color:#fff;padding:20px;border-radius:10px;">
+    <h2 style="margin:0">📈 주식 리서치 에이전트</h2>
+    <p style="margin:6px 0 0;opacity:.85">웹 대시보드 • 연결 테스트 성공 ✅</p>
+  </div>
+  <p style="margin-top:20px">매일 설정한 시간에 리서치 리포트가 이 메일로 전송됩니다.</p>
+</div>"""
+
+# 본문은 매번 같으므로 MIME 파트를 한 번만 만들어 재사용 (요청마다 헤더만 새로 작성)
+_TEST_PLAIN_PART = MIMEText("Gmail 연결 테스트 성공!", "plain", "utf-8")
+_TEST_HTML_PART = MIMEText(_TEST_EMAIL_HTML, "html", "utf-8")
+
+
+# 로그인된 Gmail SMTP 연결을 잠시 유지해 연속 전송 시 TLS/AUTH 왕복 생략
+SMTP_TTL = 60            # 연결 재사용 유지 시간(초)
+
+_smtp_pool = {"conn": None, "key": None, "expires": 0.0, "lock": threading.Lock()}
+
+
+def _smtp_close():
+    conn, _smtp_pool["conn"] = _smtp_pool["conn"], None
+    if conn is not None:
+        try:
+            conn.quit()
+        except Exception:
+            conn.close()
+
+
+def _smtp(user: str, pwd: str) -> smtplib.SMTP_SSL:
+    """로그인된 SMTP 연결 반환 (호출자가 _smtp_pool["lock"]을 잡고 있어야 함)"""
+    conn = _smtp_pool["conn"]
+    if conn is not None:
+        if _smtp_pool["key"] == (user, pwd) and time.monotonic() < _smtp_pool["expires"]:
+            try:
+                if conn.noop()[0] == 250:
+                    _smtp_pool["expires"] = time.monotonic() + SMTP_TTL
+                    return conn
+            except (smtplib.SMTPException, OSError):
+                pass
+        _smtp_close()
+
+    # SMTP_SSL 포트 465, timeout 10초
+    conn = smtplib.SMTP_SSL("smtp.gmail.com", 465, timeout=10)
+    try:
+        conn.login(user, pwd)
+    except Exception:
+        conn.close()
+        raise
+    _smtp_pool.update(conn=conn, key=(user, pwd), expires=time.monotonic() + SMTP_TTL)
+    return conn
+
+
 @app.route("/api/test_email", methods=["POST"])
 def api_test_email():
     config = load_config()
@@ -155,52 +451,92 @@ def api_test_email():
     if not gmail_user or not app_password:
         return jsonify({"success": False, "message": "Gmail 계정 정보를 먼저 입력하세요."})
 
+    jid = _start_job(_send_test_email, gmail_user, app_password, recipient)
+    return jsonify({"success": True, "job_id": jid})
+
+
+def _send_test_email(gmail_user: str, app_password: str, recipient: str, progress) -> dict:
     try:
         msg = MIMEMultipart("alternative")
         msg["Subject"] = "📈 주식 리서치 에이전트 — 연결 테스트"
         msg["From"] = f"주식 리서치 에이전트 <{gmail_user}>"
         msg["To"] = recipient
+        msg.attach(_TEST_PLAIN_PART)
+        msg.attach(_TEST_HTML_PART)
 
-        html = """<div style="font-family:'Malgun Gothic',sans-serif;max-width:500px;margin:0 auto;padding:24px;">
-  <div style="background:linear-gradient(135deg,#1a73e8,#0b3d91);color:#fff;padding:20px;border-radius:10px;">
-    <h2 style="margin:0">📈 주식 리서치 에이전트</h2>
-    <p style="margin:6px 0 0;opacity:.85">웹 대시보드 • 연결 테스트 성공 ✅</p>
-  </div>
-  <p style="margin-top:20px">매일 설정한 시간에 리서치 리포트가 이 메일로 전송됩니다.</p>
-</div>"""
-
-        msg.attach(MIMEText("Gmail 연결 테스트 성공!", "plain", "utf-8"))
-        msg.attach(MIMEText(html, "html", "utf-8"))
+        progress("Gmail 서버에 연결 중...")
+        with _smtp_pool["lock"]:
+            try:
+                server = _smtp(gmail_user, app_password)
+                progress("테스트 이메일 전송 중...")
+                server.sendmail(gmail_user, recipient, msg.as_string())
+            except (smtplib.SMTPException, OSError):
+                _smtp_close()
+                raise
 
-        # SMTP_SSL 포트 465, timeout 10초
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465, timeout=10) as server:
-            server.login(gmail_user, app_password)
-            server.sendmail(gmail_user, recipient, msg.as_string())
-
-        return jsonify({"success": True, "message": f"테스트 이메일이 {recipient}로 전송되었습니다!"})
+        return {"success": True, "message": f"테스트 이메일이 {recipient}로 전송되었습니다!"}
 
     except smtplib.SMTPAuthenticationError:
-        return jsonify({"success": False,
-                        "message": "Gmail 인증 실패 — 앱 비밀번호를 확인하세요.\n"
-                                   "(Google 계정 → 보안 → 2단계 인증 → 앱 비밀번호)"})
+        return {"success": False,
+                "message": "Gmail 인증 실패 — 앱 비밀번호를 확인하세요.\n"
+                           "(Google 계정 → 보안 → 2단계 인증 → 앱 비밀번호)"}
     except smtplib.SMTPRecipientsRefused:
-        return jsonify({"success": False,
-                        "message": f"수신자 주소가 거부되었습니다: {recipient}"})
+        return {"success": False,
+                "message": f"수신자 주소가 거부되었습니다: {recipient}"}
     except smtplib.SMTPSenderRefused:
-        return jsonify({"success": False,
-                        "message": f"발신자 주소가 거부되었습니다: {gmail_user}"})
+        return {"success": False,
+                "message": f"발신자 주소가 거부되었습니다: {gmail_user}"}
     except smtplib.SMTPException as e:
-        return jsonify({"success": False, "message": f"SMTP 오류: {e}"})
+        return {"success": False, "message": f"SMTP 오류: {e}"}
     except OSError as e:
-        return jsonify({"success": False,
-                        "message": f"네트워크 오류 — 인터넷 연결을 확인하세요: {e}"})
-    except Exception as e:
-        return jsonify({"success": False, "message": f"오류: {e}"})
+        return {"success": False,
+                "message": f"네트워크 오류 — 인터넷 연결을 확인하세요: {e}"}
+
+
+# ─────────────────────────────────────────────
+# API: 백그라운드 작업 진행 상황 (SSE)
+# ─────────────────────────────────────────────
+@app.route("/api/test_email/progress/<jid>")
+@app.route("/api/register_scheduler/progress/<jid>")
+def api_job_progress(jid):
+    with _jobs_lock:
+        q = _jobs.get(jid)
+    if q is None:
+        return jsonify({"success": False, "message": "작업을 찾을 수 없습니다."}), 404
+
+    def stream():
+        deadline = time.monotonic() + JOB_TIMEOUT
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    msg = {"done": True, "success": False, "message": "작업 시간이 초과되었습니다."}
+                    yield f"data: {orjson.dumps(msg).decode()}\n\n"
+                    return
+                try:
+                    msg = q.get(timeout=min(JOB_HEARTBEAT, remaining))
+                except queue.Empty:
+                    yield ": heartbeat\n\n"
+                    continue
+                yield f"data: {orjson.dumps(msg).decode()}\n\n"
+                if msg["done"]:
+                    return
+        finally:
+            with _jobs_lock:
+                _jobs.pop(jid, None)
+                _jobs_finished.pop(jid, None)
+
+    return Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 # ─────────────────────────────────────────────
 # API: Windows 작업 스케줄러 등록
 # ─────────────────────────────────────────────
+# 이번 서버 실행 중 등록에 성공한 setup_scheduler.bat 내용의 해시
+_registered_bat = {"digest": None}
+
+
 @app.route("/api/register_scheduler", methods=["POST"])
 def api_register_scheduler():
     config = load_config()
@@ -229,25 +565,43 @@ if %errorlevel% == 0 (
 )
 """
     
+    # 텍스트 모드 쓰기와 동일하게 OS 줄바꿈 사용 (Windows: CRLF)
+    new = bat_content.replace("\n", os.linesep).encode("utf-8")
+    digest = hashlib.blake2b(new, digest_size=8).digest()
     bat_path = script_dir / "setup_scheduler.bat"
-    with open(bat_path, "w", encoding="utf-8") as f:
-        f.write(bat_content)
-    
-    # 자동 실행 (관리자 권한 필요)
-    import subprocess
+    if bat_path.exists() and hashlib.blake2b(bat_path.read_bytes(), digest_size=8).digest() == digest:
+        # 같은 내용으로 이미 등록했다면 UAC 창 없이 바로 반환
+        if _registered_bat["digest"] == digest:
+            return jsonify({"success": True, "message": f"이미 매일 {hour:02d}:{minute:02d} 자동 실행으로 등록되어 있습니다."})
+    else:
+        bat_path.write_bytes(new)
+
+    # 자동 실행 (관리자 권한 필요) — UAC 대기가 길어 백그라운드에서 실행
+    jid = _start_job(_run_setup_scheduler, bat_path, digest, hour, minute)
+    return jsonify({"success": True, "job_id": jid})
+
+
+def _run_setup_scheduler(bat_path: Path, digest: bytes, hour: int, minute: int, progress) -> dict:
+    progress("관리자 권한으로 작업 스케줄러 등록 중...")
     try:
         result = subprocess.run(
             ["powershell", "-Command", f"Start-Process '{bat_path}' -Verb RunAs -Wait"],
-            capture_output=True,
-            text=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
             timeout=30
         )
-        return jsonify({"success": True, "message": f"매일 {hour:02d}:{minute:02d} 자동 실행 등록 완료!"})
     except Exception as e:
-        return jsonify({
-            "success": False,
-            "message": f"setup_scheduler.bat 파일을 우클릭 → 관리자 권한으로 실행하세요.\n오류: {str(e)}"
-        })
+        error = str(e)
+    else:
+        if result.returncode == 0:
+            _registered_bat["digest"] = digest
+            return {"success": True, "message": f"매일 {hour:02d}:{minute:02d} 자동 실행 등록 완료!"}
+        # UAC 거부 등으로 실패 — 다음 클릭 때 다시 등록을 시도하도록 해시를 기록하지 않음
+        error = f"종료 코드 {result.returncode}"
+    return {
+        "success": False,
+        "message": f"setup_scheduler.bat 파일을 우클릭 → 관리자 권한으로 실행하세요.\n오류: {error}"
+    }
 
 
 # ─────────────────────────────────────────────
@@ -264,40 +618,43 @@ def user_page():
 @app.route("/api/register_user", methods=["POST"])
 def api_register_user():
     data  = request.json
-    name  = data.get("name", "").strip()
-    email = data.get("email", "").strip().lower()
+    name  = _as_str(data.get("name") or "")
+    email = _as_str(data.get("email") or "").lower()
     if not name or not email:
         return jsonify({"success": False, "message": "이름과 이메일은 필수입니다."})
-
-    users = load_users()
-    # 이름 기준 중복 확인
-    existing = next((u for u in users if u["name"] == name), None)
-    now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-    if existing:
-        existing["email"]          = email
-        existing["stocks"]         = data.get("stocks", [])
-        existing["industries"]     = data.get("industries", [])
-        existing["schedule_hour"]  = int(data.get("schedule_hour", 9))
-        existing["schedule_minute"]= int(data.get("schedule_minute", 0))
-        existing["updated_at"]     = now
-        msg = f"{name}님, 설정이 업데이트되었습니다!"
-    else:
-        users.append({
-            "id":              str(uuid.uuid4()),
-            "name":            name,
-            "email":           email,
-            "stocks":          data.get("stocks", []),
-            "industries":      data.get("industries", []),
-            "schedule_hour":   int(data.get("schedule_hour", 9)),
-            "schedule_minute": int(data.get("schedule_minute", 0)),
-            "active":          True,
-            "created_at":      now,
-            "updated_at":      now,
-        })
-        msg = f"{name}님, 구독 신청 완료! 내일부터 리포트가 발송됩니다 📈"
-
-    save_users(users)
+    # null은 기본값으로 취급, 형식이 맞지 않으면 저장하지 않고 거부
+    try:
+        fields = {key: default if data.get(key) is None else coerce(data[key])
+                  for key, coerce, default in _USER_FIELDS}
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "message": "종목/산업 목록 또는 시간 형식이 올바르지 않습니다."})
+
+    # 조회~저장 사이에 다른 요청이 끼어들지 않도록 잠금
+    with _USERS.lock:
+        users = load_users()
+        # 이름 기준 중복 확인
+        existing = _USERS.by_name.get(name)
+        now = _now_str()
+
+        if existing:
+            existing.update(fields, email=email, updated_at=now)
+            msg = f"{name}님, 설정이 업데이트되었습니다!"
+        else:
+            user = {
+                "id":              str(uuid.uuid4()),
+                "name":            name,
+                "email":           email,
+                **fields,
+                "active":          True,
+                "created_at":      now,
+                "updated_at":      now,
+            }
+            users.append(user)
+            _USERS.by_name[name] = user
+            _USERS.by_id[user["id"]] = user
+            msg = f"{name}님, 구독 신청 완료! 내일부터 리포트가 발송됩니다 📈"
+
+        save_users(users)
     return jsonify({"success": True, "message": msg})
 
 
@@ -306,8 +663,8 @@ def api_register_user():
 # ─────────────────────────────────────────────
 @app.route("/api/user_by_name/<name>")
 def api_user_by_name(name):
-    users = load_users()
-    user = next((u for u in users if u["name"] == name.strip()), None)
+    load_users()
+    user = _USERS.by_name.get(name.strip())
     if user:
         return jsonify({"success": True, "user": user})
     return jsonify({"success": False})
@@ -316,30 +673,57 @@ def api_user_by_name(name):
 # ─────────────────────────────────────────────
 # API: 즉시 리포트 전송 (특정 유저)
 # ─────────────────────────────────────────────
-def _run_scheduler(args: list):
+# scheduler.py 동시 실행 수 제한 + 같은 유저 중복 실행 방지
+SCHEDULER_TIMEOUT = 15 * 60   # scheduler.py 1회 실행 최대 시간(초) — 넘기면 종료하고 다시 실행 가능하게
+_scheduler_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 2)
+_inflight: set[str] = set()
+_inflight_lock = threading.Lock()
+
+
+def _run_scheduler_child(args: list):
     script = Path(__file__).parent / "scheduler.py"
-    subprocess.Popen([sys.executable, str(script)] + args)
+    try:
+        subprocess.run([sys.executable, str(script)] + args, timeout=SCHEDULER_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        # Gemini 호출이 멈춘 경우 등 — 자식은 run()이 종료시키고, 유저는 done 콜백에서 해제됨
+        pass
+
+
+def _run_scheduler(uid: str) -> bool:
+    """유저 리포트 생성을 예약. 이미 실행 중이면 False"""
+    with _inflight_lock:
+        if uid in _inflight:
+            return False
+        _inflight.add(uid)
+    # scheduler.py는 users.json을 직접 읽으므로 대기 중인 변경사항 먼저 기록
+    _USERS.flush()
+    future = _scheduler_pool.submit(_run_scheduler_child, ["--user-id", uid])
+    future.add_done_callback(lambda f: _inflight.discard(uid))
+    return True
+
 
 @app.route("/api/send_now", methods=["POST"])
 def api_send_now():
     """user.html에서 이름 기준으로 즉시 전송"""
     data = request.json
     name = data.get("name", "").strip()
-    users = load_users()
-    user = next((u for u in users if u["name"] == name), None)
+    load_users()
+    user = _USERS.by_name.get(name)
     if not user:
         return jsonify({"success": False, "message": "먼저 구독 신청을 완료해주세요."})
-    threading.Thread(target=_run_scheduler, args=(["--user-id", user["id"]],), daemon=True).start()
+    if not _run_scheduler(user["id"]):
+        return jsonify({"success": False, "message": "이미 리포트를 생성 중입니다. 잠시 후 이메일을 확인하세요 📬"})
     return jsonify({"success": True, "message": "리포트 생성 중입니다. 약 2~3분 후 이메일을 확인하세요 📬"})
 
 @app.route("/api/send_now/<uid>", methods=["POST"])
 def api_send_now_uid(uid):
     """관리자 대시보드에서 특정 유저에게 즉시 전송"""
-    users = load_users()
-    user = next((u for u in users if u["id"] == uid), None)
+    load_users()
+    user = _USERS.by_id.get(uid)
     if not user:
         return jsonify({"success": False, "message": "유저를 찾을 수 없습니다."})
-    threading.Thread(target=_run_scheduler, args=(["--user-id", uid],), daemon=True).start()
+    if not _run_scheduler(uid):
+        return jsonify({"success": False, "message": f"{user['name']}님 리포트를 이미 생성 중입니다."})
     return jsonify({"success": True, "message": f"{user['name']}님께 전송 시작! 약 2~3분 후 확인하세요 📬"})
 
 
@@ -348,7 +732,8 @@ def api_send_now_uid(uid):
 # ─────────────────────────────────────────────
 @app.route("/api/users")
 def api_get_users():
-    return jsonify(load_users())
+    body, etag = _USERS.json_payload()
+    return _conditional(Response(body, mimetype="application/json"), etag)
 
 
 # ─────────────────────────────────────────────
@@ -356,12 +741,13 @@ def api_get_users():
 # ─────────────────────────────────────────────
 @app.route("/api/users/<uid>/toggle", methods=["POST"])
 def api_toggle_user(uid):
-    users = load_users()
-    user = next((u for u in users if u["id"] == uid), None)
-    if not user:
-        return jsonify({"success": False, "message": "유저를 찾을 수 없습니다."})
-    user["active"] = not user["active"]
-    save_users(users)
+    with _USERS.lock:
+        users = load_users()
+        user = _USERS.by_id.get(uid)
+        if not user:
+            return jsonify({"success": False, "message": "유저를 찾을 수 없습니다."})
+        user["active"] = not user["active"]
+        save_users(users)
     status = "활성화" if user["active"] else "비활성화"
     return jsonify({"success": True, "message": f"{user['name']}님 {status}", "active": user["active"]})
 
@@ -371,11 +757,14 @@ def api_toggle_user(uid):
 # ─────────────────────────────────────────────
 @app.route("/api/users/<uid>", methods=["DELETE"])
 def api_delete_user(uid):
-    users = load_users()
-    new_users = [u for u in users if u["id"] != uid]
-    if len(new_users) == len(users):
-        return jsonify({"success": False, "message": "유저를 찾을 수 없습니다."})
-    save_users(new_users)
+    with _USERS.lock:
+        load_users()
+        user = _USERS.by_id.pop(uid, None)
+        if not user:
+            return jsonify({"success": False, "message": "유저를 찾을 수 없습니다."})
+        if _USERS.by_name.get(user["name"]) is user:
+            del _USERS.by_name[user["name"]]
+        save_users(list(_USERS.by_id.values()))
     return jsonify({"success": True, "message": "삭제되었습니다."})
 
 
@@ -384,11 +773,14 @@ def api_delete_user(uid):
 # ─────────────────────────────────────────────
 @app.route("/api/report/<filename>")
 def api_get_report(filename):
+    if ".." in filename or "/" in filename or "\\" in filename:
+        abort(400)
     filepath = REPORTS_DIR / filename
-    if filepath.exists():
-        content = filepath.read_text(encoding="utf-8")
-        return jsonify({"success": True, "content": content})
-    return jsonify({"success": False, "message": "파일을 찾을 수 없습니다."})
+    if not filepath.is_file():
+        return jsonify({"success": False, "message": "파일을 찾을 수 없습니다."}), 404
+    # 마크다운 원문을 그대로 전송 (ETag/Last-Modified로 재요청 시 304)
+    return send_file(filepath.resolve(), mimetype="text/markdown", conditional=True,
+                     etag=True, last_modified=filepath.stat().st_mtime)
 
 
 if __name__ == "__main__":
@@ -402,5 +794,12 @@ if __name__ == "__main__":
     print()
     print("  종료하려면 Ctrl+C 누르세요.")
     print()
-    
-    app.run(host="0.0.0.0", port=5000, debug=True)
+
+    # waitress가 설치되어 있으면 멀티스레드 WSGI 서버로 실행
+    # (gunicorn 사용 시: gunicorn -w 1 -k gthread --threads 8 app:app)
+    try:
+        from waitress import serve
+    except ImportError:
+        app.run(host="0.0.0.0", port=5000, debug=True, threaded=True)
+    else:
+        serve(app, host="0.0.0.0", port=5000, threads=8)
@@ -6,16 +6,23 @@ config.json에서 API 키와 설정을 읽어옵니다
 
 import os
 import sys
-import json
+import io
 import re
+import asyncio
+import hashlib
 
+import time
+import sqlite3
 import datetime
 import smtplib
+import logging
 import argparse
+from dataclasses import dataclass
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from pathlib import Path
 
+import orjson
 from google import genai
 from google.genai import types
 
@@ -26,64 +33,239 @@ REPORTS_DIR = DATA_DIR / "reports"
 CONFIG_FILE = DATA_DIR / "config.json"
 USERS_FILE = DATA_DIR / "users.json"
 LOG_FILE = DATA_DIR / "scheduler.log"
+LLM_CACHE_DB = DATA_DIR / "cache.sqlite"
 
 DATA_DIR.mkdir(exist_ok=True)
 REPORTS_DIR.mkdir(exist_ok=True)
 
 MODEL = "gemini-2.5-flash"
 
+# 실행 기준 날짜·프롬프트 머리말 (한 번 실행하고 끝나는 스크립트라 로드 시 한 번만 계산)
+TODAY           = datetime.date.today()
+TODAY_ISO       = TODAY.isoformat()
+TODAY_STR       = TODAY.strftime("%Y년 %m월 %d일")
+YESTERDAY_STR   = (TODAY - datetime.timedelta(days=1)).strftime("%Y년 %m월 %d일")
+TODAY_SHORT     = TODAY.strftime("%m/%d")
+YESTERDAY_SHORT = (TODAY - datetime.timedelta(days=1)).strftime("%m/%d")
+SEARCH_PREAMBLE = f"오늘은 {TODAY_STR}입니다. Google 검색으로 "
+
+GEMINI_CONCURRENCY = 5   # 동시 Gemini 호출 수 기본값 (config.json의 gemini_concurrency로 변경)
+GEMINI_RPM = 0           # 분당 Gemini 호출 상한 기본값, 0이면 제한 없음 (config.json의 gemini_rpm으로 변경)
+GEMINI_RETRIES = 3       # 호출 실패 시 최대 시도 횟수 (지수 백오프)
+USER_WORKERS = 4         # 전체 발송 모드에서 동시에 이메일을 준비하는 유저 수 (config.json의 user_workers로 변경)
+
+_gemini_sem: asyncio.Semaphore = None
+_gemini_rate: "RateLimiter" = None
+
+
+# 로그 파일은 한 번만 열어 두고 계속 이어서 기록 (콘솔에도 같은 형식으로 출력)
+_logger = logging.getLogger("scheduler")
+_logger.setLevel(logging.INFO)
+_logger.propagate = False
+_log_fmt = logging.Formatter("[%(asctime)s] %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
+for _handler in (logging.FileHandler(LOG_FILE, encoding="utf-8", delay=True),
+                 logging.StreamHandler(sys.stdout)):
+    _handler.setFormatter(_log_fmt)
+    _logger.addHandler(_handler)
+
 
 def log(msg: str):
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    line = f"[{timestamp}] {msg}"
-    print(line)
-    with open(LOG_FILE, "a", encoding="utf-8") as f:
-        f.write(line + "\n")
+    _logger.info(msg)
+
+
+def _read_json(path: Path, default):
+    """파일이 없으면 default — exists() 확인 없이 바로 읽어 stat 한 번을 아낌"""
+    try:
+        return orjson.loads(path.read_bytes())
+    except FileNotFoundError:
+        return default
 
 
 def load_config() -> dict:
-    if CONFIG_FILE.exists():
-        with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {}
+    return _read_json(CONFIG_FILE, {})
 
 
 def load_watchlist() -> dict:
-    if WATCHLIST_FILE.exists():
-        with open(WATCHLIST_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {"stocks": [], "industries": []}
+    return _read_json(WATCHLIST_FILE, {"stocks": [], "industries": []})
 
 
 def load_users() -> list:
-    if USERS_FILE.exists():
-        with open(USERS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return []
-
-
-def call_gemini(client, prompt: str) -> str:
-    response = client.models.generate_content(
-        model=MODEL,
-        contents=prompt,
-        config=types.GenerateContentConfig(
-            tools=[types.Tool(google_search=types.GoogleSearch())],
-            temperature=0.3,
+    return _read_json(USERS_FILE, [])
+
+
+GEN_CONFIG = types.GenerateContentConfig(
+    tools=[types.Tool(google_search=types.GoogleSearch())],
+    temperature=0.3,
+)
+
+
+class RateLimiter:
+    """호출 시작 간격을 60/rpm초 이상으로 벌려 분당 요청 수를 제한 (rpm이 0이면 제한 없음)"""
+
+    def __init__(self, rpm: int):
+        self.interval = 60 / rpm if rpm > 0 else 0
+        self.next_at = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self.lock:
+            loop = asyncio.get_running_loop()
+            delay = self.next_at - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.next_at = max(self.next_at, loop.time()) + self.interval
+
+
+async def _with_retry(request):
+    """request() 실행 — 동시 호출 수·분당 호출 수 제한 + 실패 시 지수 백오프로 재시도"""
+    for attempt in range(GEMINI_RETRIES):
+        try:
+            # 동시 호출 수를 제한해 분당 요청 한도(RPM) 안에서 병렬 실행
+            async with _gemini_sem:
+                await _gemini_rate.wait()
+                return await request()
+        except Exception as e:
+            if attempt == GEMINI_RETRIES - 1:
+                raise
+            delay = 2 ** attempt
+            log(f"⚠️ Gemini 호출 실패, {delay}초 후 재시도: {e}")
+            await asyncio.sleep(delay)
+
+
+async def call_gemini(client, prompt: str) -> str:
+    async def request():
+        response = await client.aio.models.generate_content(
+            model=MODEL, contents=prompt, config=GEN_CONFIG,
         )
-    )
-    return response.text
+        return response.text
+    return await _with_retry(request)
+
+
+async def call_gemini_bulleted(client, prompt: str, max_bullets: int) -> str:
+    """스트리밍으로 받다가 bullet(- ) 줄이 max_bullets개 완성되면 바로 끊고 반환"""
+    async def request():
+        stream = await client.aio.models.generate_content_stream(
+            model=MODEL, contents=prompt, config=GEN_CONFIG,
+        )
+        parts = []
+        lines = []
+        bullets = 0
+        tail = ""
+        try:
+            async for chunk in stream:
+                text = chunk.text or ""
+                parts.append(text)
+                *done, tail = (tail + text).split("\n")
+                for line in done:
+                    lines.append(line)
+                    if line.lstrip().startswith("- "):
+                        bullets += 1
+                        if bullets >= max_bullets:
+                            return "\n".join(lines)
+        finally:
+            aclose = getattr(stream, "aclose", None)
+            if aclose is not None:
+                await aclose()
+        return "".join(parts)
+    return await _with_retry(request)
+
+
+# ── 응답 캐시 ──────────────────────────────────────────────────────────────
+# 같은 날 같은 입력(포트폴리오 구성·대상)·모델이면 Gemini 응답을 재사용
+# (구독자 간 중복 포트폴리오 + 같은 날 재실행 시 LLM 호출 생략)
+# 응답은 받는 즉시 cache.sqlite에 기록 — 실행이 중간에 실패해도 재실행 때 그대로 재사용
+
+LLM_CACHE_TTL = 24 * 60 * 60   # 캐시 유효 시간(초)
+
+_llm_db: sqlite3.Connection = None
+_llm_cache: dict = {}
+_llm_pending: dict = {}
+
+
+def cache_key(*parts) -> str:
+    return hashlib.sha256(orjson.dumps([*parts, TODAY_ISO, MODEL])).hexdigest()
+
+
+def open_llm_cache():
+    """캐시 DB 열기 (WAL 모드) + 유효 시간이 지난 항목 정리"""
+    global _llm_db
+    _llm_cache.clear()
+    _llm_db = sqlite3.connect(LLM_CACHE_DB, isolation_level=None)
+    _llm_db.execute("PRAGMA journal_mode=WAL")
+    _llm_db.execute("CREATE TABLE IF NOT EXISTS llm_cache(key TEXT PRIMARY KEY, value TEXT, ts INTEGER)")
+    _llm_db.execute("DELETE FROM llm_cache WHERE ts <= ?", (int(time.time()) - LLM_CACHE_TTL,))
+
+
+def close_llm_cache():
+    global _llm_db
+    if _llm_db is not None:
+        _llm_db.close()
+        _llm_db = None
+
+
+def _db_get(key: str):
+    if _llm_db is None:
+        return None
+    row = _llm_db.execute(
+        "SELECT value FROM llm_cache WHERE key = ? AND ts > ?",
+        (key, int(time.time()) - LLM_CACHE_TTL),
+    ).fetchone()
+    return row[0] if row else None
+
+
+def _db_put(key: str, value: str):
+    if _llm_db is not None:
+        _llm_db.execute(
+            "INSERT OR REPLACE INTO llm_cache(key, value, ts) VALUES (?, ?, ?)",
+            (key, value, int(time.time())),
+        )
+
+
+async def memoized(key: str, factory) -> str:
+    """key에 대한 캐시(메모리 → DB)가 있으면 반환, 없으면 factory() 결과를 캐시 (동시 요청은 1회만 호출)"""
+    if key in _llm_cache:
+        return _llm_cache[key]
+    value = _db_get(key)
+    if value is not None:
+        _llm_cache[key] = value
+        return value
+    task = _llm_pending.get(key)
+    if task is None:
+        task = _llm_pending[key] = asyncio.ensure_future(factory())
+        task.add_done_callback(lambda _: _llm_pending.pop(key, None))
+    value = await task
+    if value and key not in _llm_cache:
+        _llm_cache[key] = value
+        _db_put(key, value)
+    return value
 
 
 # ── 공통 섹션 ──────────────────────────────────────────────────────────────
 
-def get_portfolio_overview(client, stocks: list, industries: list) -> str:
-    """📌 오늘의 포트폴리오 요약 — 자산별 1줄"""
-    today = datetime.date.today().strftime("%Y년 %m월 %d일")
+@dataclass(frozen=True, slots=True)
+class PortfolioCtx:
+    """유저 한 명의 포트폴리오 프롬프트 재료 — 유저당 한 번 만들어 섹션 헬퍼들이 공유"""
+    targets_str: str   # "종목, 산업, ..." (비어 있으면 "없음")
+    count: int         # 종목 + 산업 수
+    cache_id: tuple    # (정렬된 종목, 정렬된 산업) — 캐시 키용
+
+
+def portfolio_ctx(stocks: list, industries: list) -> PortfolioCtx:
     all_targets = list(stocks) + list(industries)
-    targets_str = ", ".join(all_targets) or "없음"
-    count = len(all_targets)
+    return PortfolioCtx(
+        targets_str=", ".join(all_targets) or "없음",
+        count=len(all_targets),
+        cache_id=(sorted(stocks), sorted(industries)),
+    )
+
+
+async def get_portfolio_overview(client, ctx: PortfolioCtx) -> str:
+    """📌 오늘의 포트폴리오 요약 — 자산별 1줄"""
+    count, targets_str = ctx.count, ctx.targets_str
     prompt = (
-        f"오늘은 {today}입니다. Google 검색으로 최신 시장 정보를 확인하여 "
+        f"{SEARCH_PREAMBLE}최신 시장 정보를 확인하여 "
         f"아래 {count}개 종목/산업 각각에 대해 정확히 {count}줄을 작성하세요.\n"
         f"종목/산업 목록: {targets_str}\n\n"
         f"형식 (1개 종목/산업당 1줄):\n"
@@ -96,16 +278,15 @@ def get_portfolio_overview(client, stocks: list, industries: list) -> str:
         f"- 한화에어로스페이스 → 목표주가 상향, 모멘텀 유효 / 액션: 눌림목 관찰\n"
         f"- 전력 → 데이터센터 수요 증가 / 액션: 분할매수"
     )
-    return call_gemini(client, prompt)
+    key = cache_key("overview", *ctx.cache_id)
+    return await memoized(key, lambda: call_gemini_bulleted(client, prompt, max(count, 1)))
 
 
-def get_portfolio_risk(client, stocks: list, industries: list) -> str:
+async def get_portfolio_risk(client, ctx: PortfolioCtx) -> str:
     """⚠️ 오늘의 포트폴리오 리스크 — 전체 포트 기준 1~2줄"""
-    today = datetime.date.today().strftime("%Y년 %m월 %d일")
-    all_targets = list(stocks) + list(industries)
-    targets_str = ", ".join(all_targets) or "없음"
+    targets_str = ctx.targets_str
     prompt = (
-        f"오늘은 {today}입니다. Google 검색으로 최신 정보를 확인하여 "
+        f"{SEARCH_PREAMBLE}최신 정보를 확인하여 "
         f"아래 포트폴리오 전체에 영향을 미치는 공통 리스크를 작성하세요.\n"
         f"포트폴리오: {targets_str}\n\n"
         f"규칙:\n"
@@ -117,15 +298,14 @@ def get_portfolio_risk(client, stocks: list, industries: list) -> str:
         f"- 미 연준 긴축 장기화 → 성장주 전반 밸류에이션 압박\n"
         f"- 원/달러 환율 급등 → 수입 비용 증가, 내수주 부담"
     )
-    return call_gemini(client, prompt)
+    key = cache_key("risk", *ctx.cache_id)
+    return await memoized(key, lambda: call_gemini_bulleted(client, prompt, 2))
 
 
-def get_news_summary(client) -> str:
+async def get_news_summary(client) -> str:
     """📰 시장 방향 & 심리 — bullet 최대 3개"""
-    yesterday = (datetime.date.today() - datetime.timedelta(days=1)).strftime("%Y년 %m월 %d일")
-    today = datetime.date.today().strftime("%Y년 %m월 %d일")
     prompt = (
-        f"어제({yesterday})~오늘({today}) 글로벌·한국 주식시장을 Google 검색으로 확인하여 "
+        f"어제({YESTERDAY_STR})~오늘({TODAY_STR}) 글로벌·한국 주식시장을 Google 검색으로 확인하여 "
         f"핵심 요인 정확히 3개를 작성하세요.\n\n"
         f"규칙:\n"
         f"- 안내 문구·서론 없이 bullet(- )만 바로 출력\n"
@@ -136,16 +316,14 @@ def get_news_summary(client) -> str:
         f"- 트럼프 관세 불확실성 → 수출주 변동성 확대\n"
         f"- AI 반도체 업황 개선 → 기술주 강세"
     )
-    return call_gemini(client, prompt)
+    return await memoized(cache_key("news"), lambda: call_gemini_bulleted(client, prompt, 3))
 
 
-def get_report_footer(client, stocks: list, industries: list) -> str:
+async def get_report_footer(client, ctx: PortfolioCtx) -> str:
     """⏱ 타임프레임 관점 — 자산별 단기/중기/장기 1줄씩"""
-    today = datetime.date.today().strftime("%Y년 %m월 %d일")
-    all_targets = list(stocks) + list(industries)
-    targets_str = ", ".join(all_targets) or "없음"
+    targets_str = ctx.targets_str
     prompt = (
-        f"오늘은 {today}입니다. Google 검색으로 최신 정보를 확인하여 "
+        f"{SEARCH_PREAMBLE}최신 정보를 확인하여 "
         f"아래 종목/산업 각각의 타임프레임 관점을 한국어로 작성하세요.\n"
         f"종목/산업: {targets_str}\n\n"
         f"각 자산마다 아래 형식으로 작성하세요. 안내 문구·반복 문구 금지.\n"
@@ -154,18 +332,69 @@ def get_report_footer(client, stocks: list, industries: list) -> str:
         f"- 중기(1~3개월): 모멘텀·실적 사이클 1줄 (10단어 이내)\n"
         f"- 장기(1년): 구조적 성장 스토리 1줄 (10단어 이내)"
     )
-    return call_gemini(client, prompt)
+    key = cache_key("footer", *ctx.cache_id)
+    return await memoized(key, lambda: call_gemini(client, prompt))
+
+
+_RE_BUNDLE = re.compile(r"^###\s*(OVERVIEW|RISK|FOOTER)\s*###\s*$", re.M)
+
+
+def split_bundle(text: str) -> dict:
+    """'### OVERVIEW ###' 등 구분선 기준으로 섹션 분리 → {"OVERVIEW": ..., ...}"""
+    parts = _RE_BUNDLE.split(text or "")
+    return {name: body.strip() for name, body in zip(parts[1::2], parts[2::2]) if body.strip()}
+
+
+async def get_portfolio_bundle(client, ctx: PortfolioCtx) -> tuple:
+    """📌 요약 / ⚠️ 리스크 / ⏱ 타임프레임을 Gemini 호출 한 번으로 받음 (빠진 섹션만 개별 호출)"""
+    count, targets_str = ctx.count, ctx.targets_str
+    prompt = (
+        f"{SEARCH_PREAMBLE}최신 시장 정보를 확인하여 "
+        f"아래 포트폴리오에 대해 세 섹션을 한국어로 작성하세요.\n"
+        f"종목/산업 목록: {targets_str}\n\n"
+        f"각 섹션은 반드시 구분선 한 줄(### OVERVIEW ###, ### RISK ###, ### FOOTER ###)로 시작하고, "
+        f"안내 문구·서론 없이 세 섹션만 출력하세요.\n\n"
+        f"### OVERVIEW ###\n"
+        f"{count}개 종목/산업 각각에 대해 정확히 {count}줄 (1개 종목/산업당 1줄):\n"
+        f"- 자산명 → 핵심 해석 / 액션: (관망·매수·비중조절·리스크관리 중 1개)\n"
+        f"규칙: 자산명 뒤 내용은 10단어 이내 / bullet(- )만 / 마크다운(#, ** 등) 금지\n"
+        f"예시: - 한화에어로스페이스 → 목표주가 상향, 모멘텀 유효 / 액션: 눌림목 관찰\n\n"
+        f"### RISK ###\n"
+        f"포트폴리오 전체에 영향을 미치는 공통 리스크 (개별 종목 리스크 제외)\n"
+        f"규칙: bullet(- ) 1~2개, 각 12단어 이내 / 마크다운 금지\n"
+        f"예시: - 미 연준 긴축 장기화 → 성장주 전반 밸류에이션 압박\n\n"
+        f"### FOOTER ###\n"
+        f"각 자산마다 아래 형식으로 타임프레임 관점 작성 (반복 문구 금지):\n"
+        f"### 자산명\n"
+        f"- 단기(7일): 이벤트·수급 중심 1줄 (10단어 이내)\n"
+        f"- 중기(1~3개월): 모멘텀·실적 사이클 1줄 (10단어 이내)\n"
+        f"- 장기(1년): 구조적 성장 스토리 1줄 (10단어 이내)"
+    )
+    key = cache_key("bundle", *ctx.cache_id)
+    sections = split_bundle(await memoized(key, lambda: call_gemini(client, prompt)))
+
+    # 응답에서 빠진 섹션은 개별 프롬프트로 보충
+    fallbacks = {
+        "OVERVIEW": get_portfolio_overview,
+        "RISK":     get_portfolio_risk,
+        "FOOTER":   get_report_footer,
+    }
+    missing = [name for name in fallbacks if name not in sections]
+    if missing:
+        log(f"⚠️ 포트폴리오 묶음 응답에 {', '.join(missing)} 없음 — 개별 호출")
+        results = await asyncio.gather(*(fallbacks[name](client, ctx) for name in missing))
+        sections.update(zip(missing, results))
+    return sections["OVERVIEW"], sections["RISK"], sections["FOOTER"]
 
 
 # ── 개별 리서치 ────────────────────────────────────────────────────────────
 
-def run_research(client, target: str, research_type: str) -> str:
-    today = datetime.date.today().strftime("%Y년 %m월 %d일")
+async def run_research(client, target: str, research_type: str) -> str:
 
     if research_type == "stock":
         # 종목 템플릿 — 포지션 판단용 (5개 항목)
         prompt = (
-            f"오늘은 {today}입니다. Google 검색으로 '{target}' 종목의 최신 정보를 조사하여 "
+            f"{SEARCH_PREAMBLE}'{target}' 종목의 최신 정보를 조사하여 "
             f"아래 5개 항목만 한국어로 작성하세요.\n"
             f"금지: 뉴스 나열 / 숫자·가격·목표가·거래량 직접 기재 / 중복 문장\n\n"
             f"## 📌 한줄 요약\n"
@@ -183,7 +412,7 @@ def run_research(client, target: str, research_type: str) -> str:
     else:
         # 산업 템플릿 — 자금 흐름 판단용 (6개 항목)
         prompt = (
-            f"오늘은 {today}입니다. Google 검색으로 '{target}' 산업의 최신 정보를 조사하여 "
+            f"{SEARCH_PREAMBLE}'{target}' 산업의 최신 정보를 조사하여 "
             f"아래 6개 항목만 한국어로 작성하세요.\n"
             f"금지: 개별 기업 실적·가격·세부 통계 나열 / 중복 문장\n\n"
             f"## 📌 한줄 요약\n"
@@ -200,7 +429,8 @@ def run_research(client, target: str, research_type: str) -> str:
             f"## ⚠️ 리스크\n"
             f"(핵심 리스크 1줄, 12단어 이내)"
         )
-    return call_gemini(client, prompt)
+    key = cache_key("research", research_type, target)
+    return await memoized(key, lambda: call_gemini(client, prompt))
 
 
 def save_report(target: str, research_type: str, content: str) -> Path:
@@ -211,104 +441,143 @@ def save_report(target: str, research_type: str, content: str) -> Path:
         f"# 📈 {type_label} 리서치: {target}\n"
         f"> {datetime.datetime.now().strftime('%Y년 %m월 %d일 %H:%M')}\n\n---\n\n"
     )
-    with open(filename, "w", encoding="utf-8") as f:
-        f.write(header + content)
+    # 인코딩은 한 번에, 파일 쓰기는 write 시스템 콜 한 번으로
+    payload = (header + content).encode("utf-8")
+    fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.write(fd, payload)
+    finally:
+        os.close(fd)
     return filename
 
 
-def md_to_html(text: str) -> str:
-    """마크다운을 이메일용 HTML로 변환"""
-    def inline(s: str) -> str:
-        s = re.sub(r"\*\*(.+?)\*\*", r"<strong>\1</strong>", s)
-        s = re.sub(r"\*(.+?)\*", r"<em>\1</em>", s)
-        s = re.sub(r"`(.+?)`", r"<code style='background:#f4f4f4;padding:1px 4px;border-radius:3px'>\1</code>", s)
+# md_to_html에서 쓰는 정규식·HTML 조각 (모듈 로드 시 한 번만 생성)
+_RE_OL     = re.compile(r"^\d+\. ")
+
+_CODE_OPEN = "<code style='background:#f4f4f4;padding:1px 4px;border-radius:3px'>"
+_UL_OPEN   = '<ul style="margin:4px 0;padding-left:18px;line-height:1.7">\n'
+_OL_OPEN   = '<ol style="margin:4px 0;padding-left:18px;line-height:1.7">\n'
+_HR        = '<hr style="border:none;border-top:1px solid #eee;margin:10px 0">\n'
+
+
+def _wrap_pairs(s: str, marker: str, open_tag: str, close_tag: str) -> str:
+    """marker로 감싼 최단 구간을 태그로 치환 (정규식 marker(.+?)marker 와 동일한 결과)"""
+    i = s.find(marker)
+    if i < 0:
         return s
+    n = len(marker)
+    parts = []
+    pos = 0
+    while i >= 0:
+        j = s.find(marker, i + n + 1)
+        if j < 0:
+            break
+        parts += (s[pos:i], open_tag, s[i + n:j], close_tag)
+        pos = j + n
+        i = s.find(marker, pos)
+    parts.append(s[pos:])
+    return "".join(parts)
+
+
+def _inline(s: str) -> str:
+    """**굵게** → *기울임* → `코드` 순서로 치환"""
+    if "*" in s:
+        s = _wrap_pairs(s, "**", "<strong>", "</strong>")
+        s = _wrap_pairs(s, "*", "<em>", "</em>")
+    if "`" in s:
+        s = _wrap_pairs(s, "`", _CODE_OPEN, "</code>")
+    return s
 
-    lines = text.split("\n")
-    out = []
+
+def md_to_html(text: str) -> str:
+    """마크다운을 이메일용 HTML로 변환"""
+    buf = io.StringIO()
+    write = buf.write
     in_ul = False
     in_ol = False
 
-    def close_lists():
-        nonlocal in_ul, in_ol
-        if in_ul:
-            out.append("</ul>")
+    for line in text.splitlines():
+        # 정규식 전에 앞글자만으로 줄 종류 판별
+        if line.startswith("#"):
+            if line.startswith("### "):
+                kind = "h4"
+            elif line.startswith("## "):
+                kind = "h3"
+            elif line.startswith("# "):
+                kind = "h2"
+            else:
+                kind = "p"
+        elif line[:2] in ("- ", "* "):
+            kind = "ul"
+        elif line[:1].isdigit() and _RE_OL.match(line):
+            kind = "ol"
+        else:
+            stripped = line.strip()
+            if stripped in ("---", "***", "___"):
+                kind = "hr"
+            elif not stripped:
+                kind = "blank"
+            else:
+                kind = "p"
+
+        if in_ul and kind != "ul":
+            write("</ul>\n")
             in_ul = False
-        if in_ol:
-            out.append("</ol>")
+        if in_ol and kind != "ol":
+            write("</ol>\n")
             in_ol = False
 
-    for line in lines:
-        if line.startswith("### "):
-            close_lists()
-            out.append(f'<h4 style="color:#555;font-size:13px;font-weight:700;margin:12px 0 3px">{inline(line[4:])}</h4>')
-        elif line.startswith("## "):
-            close_lists()
-            out.append(
-                f'<h3 style="color:#1a73e8;font-size:14px;font-weight:700;'
-                f'margin:14px 0 5px;padding-left:8px;'
-                f'border-left:3px solid #1a73e8">{inline(line[3:])}</h3>'
-            )
-        elif line.startswith("# "):
-            close_lists()
-            out.append(f'<h2 style="color:#0b3d91;font-size:16px;margin:16px 0 8px">{inline(line[2:])}</h2>')
-        elif line.strip() in ("---", "***", "___"):
-            close_lists()
-            out.append('<hr style="border:none;border-top:1px solid #eee;margin:10px 0">')
-        elif re.match(r"^[-*] ", line):
-            if in_ol:
-                out.append("</ol>")
-                in_ol = False
+        if kind == "ul":
             if not in_ul:
-                out.append('<ul style="margin:4px 0;padding-left:18px;line-height:1.7">')
+                write(_UL_OPEN)
                 in_ul = True
-            out.append(f'<li>{inline(line[2:])}</li>')
-        elif re.match(r"^\d+\. ", line):
-            if in_ul:
-                out.append("</ul>")
-                in_ul = False
+            write(f"<li>{_inline(line[2:])}</li>\n")
+        elif kind == "ol":
             if not in_ol:
-                out.append('<ol style="margin:4px 0;padding-left:18px;line-height:1.7">')
+                write(_OL_OPEN)
                 in_ol = True
-            content = re.sub(r"^\d+\. ", "", line)
-            out.append(f'<li>{inline(content)}</li>')
-        elif line.strip() == "":
-            close_lists()
-            out.append("")
+            write(f"<li>{_inline(line[line.index('. ') + 2:])}</li>\n")
+        elif kind == "h4":
+            write(f'<h4 style="color:#555;font-size:13px;font-weight:700;margin:12px 0 3px">{_inline(line[4:])}</h4>\n')
+        elif kind == "h3":
+            write(
+                f'<h3 style="color:#1a73e8;font-size:14px;font-weight:700;'
+                f'margin:14px 0 5px;padding-left:8px;'
+                f'border-left:3px solid #1a73e8">{_inline(line[3:])}</h3>\n'
+            )
+        elif kind == "h2":
+            write(f'<h2 style="color:#0b3d91;font-size:16px;margin:16px 0 8px">{_inline(line[2:])}</h2>\n')
+        elif kind == "hr":
+            write(_HR)
+        elif kind == "blank":
+            write("\n")
         else:
-            close_lists()
-            out.append(f'<p style="margin:4px 0;line-height:1.7">{inline(line)}</p>')
+            write(f'<p style="margin:4px 0;line-height:1.7">{_inline(line)}</p>\n')
 
-    close_lists()
-    return "\n".join(out)
+    if in_ul:
+        write("</ul>\n")
+    if in_ol:
+        write("</ol>\n")
+    return buf.getvalue()
 
 
-def build_html_email(reports: list, news_summary: str, portfolio_overview: str,
-                     portfolio_risk: str, report_footer: str) -> str:
-    today_str = datetime.datetime.now().strftime("%Y년 %m월 %d일 %H:%M")
-    yesterday_str = (datetime.date.today() - datetime.timedelta(days=1)).strftime("%m/%d")
-    today_short = datetime.date.today().strftime("%m/%d")
+# ── 이메일 템플릿 (모듈 로드 시 한 번만 생성, 유저별로는 값만 채움) ──────────
 
-    # ── 1. 포트폴리오 요약 ───────────────────────────────
-    portfolio_section = f"""
+_PORTFOLIO_TMPL = """
 <div style="background:#fff;border-radius:10px;margin:16px 0;padding:20px;box-shadow:0 2px 8px rgba(0,0,0,.1);border-left:4px solid #1a73e8">
   <div style="font-weight:700;font-size:15px;color:#1a73e8;margin-bottom:12px">📌 오늘의 포트폴리오 요약</div>
-  {md_to_html(portfolio_overview.strip())}
+  {body}
 </div>"""
 
-    # ── 2. 포트폴리오 리스크 ─────────────────────────────
-    risk_section = f"""
+_RISK_TMPL = """
 <div style="background:#fff8e1;border-radius:10px;margin:16px 0;padding:20px;box-shadow:0 2px 8px rgba(0,0,0,.1);border-left:4px solid #f4b400">
   <div style="font-weight:700;font-size:15px;color:#b06000;margin-bottom:12px">⚠️ 오늘의 포트폴리오 리스크</div>
-  {md_to_html(portfolio_risk.strip())}
+  {body}
 </div>"""
 
-    # ── 3. 시장 방향 & 심리 ──────────────────────────────
-    news_lines = "".join(
-        f'<p style="margin:0 0 10px;line-height:1.7;color:#333;font-size:13px">{line.strip()}</p>'
-        for line in news_summary.strip().split("\n") if line.strip()
-    )
-    news_section = f"""
+_NEWS_LINE_TMPL = '<p style="margin:0 0 10px;line-height:1.7;color:#333;font-size:13px">{}</p>'
+
+_NEWS_TMPL = """
 <div style="background:#fff;border-radius:10px;margin:16px 0;padding:20px;box-shadow:0 2px 8px rgba(0,0,0,.1)">
   <div style="display:flex;align-items:center;gap:8px;margin-bottom:14px">
     <span style="font-weight:700;font-size:15px;color:#0b3d91">📰 시장 방향 & 심리</span>
@@ -317,31 +586,28 @@ def build_html_email(reports: list, news_summary: str, portfolio_overview: str,
   {news_lines}
 </div>"""
 
-    # ── 4. 종목/산업 카드 ────────────────────────────────
-    cards = ""
-    for r in reports:
-        icon = "📌" if r["type"] == "stock" else "🏭"
-        label = "종목" if r["type"] == "stock" else "산업"
-        label_color = "#1a73e8" if r["type"] == "stock" else "#34a853"
-        label_bg = "#e8f0fe" if r["type"] == "stock" else "#e6f4ea"
-        body_html = md_to_html(r["content"])
-        cards += f"""
+_CARD_TMPL = """
 <div style="background:#fff;border-radius:10px;margin:12px 0;box-shadow:0 2px 8px rgba(0,0,0,.1);overflow:hidden">
   <div style="padding:14px 20px;border-bottom:1px solid #f0f0f0;display:flex;align-items:center;gap:8px">
     <span style="background:{label_bg};color:{label_color};font-size:11px;padding:2px 8px;border-radius:10px;font-weight:700">{label}</span>
-    <span style="font-weight:700;font-size:16px;color:#222">{icon} {r["target"]}</span>
+    <span style="font-weight:700;font-size:16px;color:#222">{icon} {target}</span>
   </div>
   <div style="padding:14px 20px 18px">{body_html}</div>
 </div>"""
 
-    # ── 5. 타임프레임 관점 ───────────────────────────────
-    footer_section = f"""
+# 리포트 유형별 카드 표시값 (label, label_color, label_bg, icon)
+_CARD_META = {
+    "stock":    ("종목", "#1a73e8", "#e8f0fe", "📌"),
+    "industry": ("산업", "#34a853", "#e6f4ea", "🏭"),
+}
+
+_FOOTER_TMPL = """
 <div style="background:#fff;border-radius:10px;margin:16px 0;padding:20px;box-shadow:0 2px 8px rgba(0,0,0,.1);border-left:4px solid #34a853">
   <div style="font-weight:700;font-size:15px;color:#2d8e47;margin-bottom:12px">⏱ 타임프레임 관점</div>
-  {md_to_html(report_footer.strip())}
+  {body}
 </div>"""
 
-    return f"""<!DOCTYPE html>
+_EMAIL_SHELL = """<!DOCTYPE html>
 <html lang="ko">
 <head>
 <meta charset="UTF-8">
@@ -351,7 +617,7 @@ def build_html_email(reports: list, news_summary: str, portfolio_overview: str,
 <div style="max-width:680px;margin:0 auto">
   <div style="background:linear-gradient(135deg,#1a73e8,#0b3d91);color:#fff;padding:24px 28px;border-radius:12px;margin-bottom:4px">
     <h1 style="margin:0;font-size:22px">📈 주식 리서치 에이전트</h1>
-    <p style="margin:6px 0 0;opacity:.85;font-size:14px">{today_str} &nbsp;•&nbsp; {len(reports)}개 종목/산업</p>
+    <p style="margin:6px 0 0;opacity:.85;font-size:14px">{today_str} &nbsp;•&nbsp; {count}개 종목/산업</p>
   </div>
 
   {portfolio_section}
@@ -365,29 +631,125 @@ def build_html_email(reports: list, news_summary: str, portfolio_overview: str,
   {footer_section}
 
   <div style="background:#fff8e1;padding:14px 20px;border-radius:10px;font-size:12px;color:#888;margin-top:8px;line-height:1.7">
-    ⚠️ 본 리포트는 AI가 생성한 정보 제공용 자료이며 투자 권유가 아닙니다.
+    ⚠️ {disclaimer}
   </div>
 </div>
 </body>
 </html>"""
 
+_DISCLAIMER = "본 리포트는 AI가 생성한 정보 제공용 자료이며 투자 권유가 아닙니다."
+
+
+@dataclass(frozen=True, slots=True)
+class EmailBody:
+    """이메일 본문 — HTML과 텍스트 파트 (텍스트는 HTML을 다시 긁지 않고 원본 섹션으로 바로 구성)"""
+    html: str
+    plain: str
+
+
+def _render_card(r: dict) -> str:
+    label, label_color, label_bg, icon = _CARD_META.get(r["type"], _CARD_META["industry"])
+    return _CARD_TMPL.format_map({
+        "label": label, "label_color": label_color, "label_bg": label_bg, "icon": icon,
+        "target": r["target"], "body_html": md_to_html(r["content"]),
+    })
+
+
+def build_html_email(reports: list, news_summary: str, portfolio_overview: str,
+                     portfolio_risk: str, report_footer: str) -> EmailBody:
+    today_str = datetime.datetime.now().strftime("%Y년 %m월 %d일 %H:%M")
+    news_summary       = news_summary.strip()
+    portfolio_overview = portfolio_overview.strip()
+    portfolio_risk     = portfolio_risk.strip()
+    report_footer      = report_footer.strip()
+
+    news_lines = "".join(
+        _NEWS_LINE_TMPL.format(line.strip())
+        for line in news_summary.split("\n") if line.strip()
+    )
+    html = _EMAIL_SHELL.format_map({
+        "today_str":         today_str,
+        "count":             len(reports),
+        "portfolio_section": _PORTFOLIO_TMPL.format(body=md_to_html(portfolio_overview)),
+        "risk_section":      _RISK_TMPL.format(body=md_to_html(portfolio_risk)),
+        "news_section":      _NEWS_TMPL.format(yesterday_str=YESTERDAY_SHORT, today_short=TODAY_SHORT,
+                                               news_lines=news_lines),
+        "cards":             "".join([_render_card(r) for r in reports]),
+        "footer_section":    _FOOTER_TMPL.format(body=md_to_html(report_footer)),
+        "disclaimer":        _DISCLAIMER,
+    })
+
+    # 텍스트 파트 — 이미 갖고 있는 마크다운 섹션을 HTML과 같은 순서로 이어 붙임
+    plain_parts = [
+        f"📈 주식 리서치 에이전트\n{today_str} • {len(reports)}개 종목/산업",
+        f"📌 오늘의 포트폴리오 요약\n{portfolio_overview}",
+        f"⚠️ 오늘의 포트폴리오 리스크\n{portfolio_risk}",
+        f"📰 시장 방향 & 심리 ({YESTERDAY_SHORT} ~ {TODAY_SHORT})\n{news_summary}",
+    ]
+    for r in reports:
+        label, _, _, icon = _CARD_META.get(r["type"], _CARD_META["industry"])
+        plain_parts.append(f"{icon} {r['target']} [{label}]\n{r['content'].strip()}")
+    plain_parts.append(f"⏱ 타임프레임 관점\n{report_footer}")
+    plain_parts.append(f"⚠️ {_DISCLAIMER}")
+    return EmailBody(html=html, plain="\n\n".join(plain_parts))
+
+
+class SmtpSession:
+    """실행 동안 Gmail SMTP 연결을 한 번만 열어 재사용 (첫 전송 시 연결, 끊기면 재연결)"""
+
+    def __init__(self, config: dict):
+        self.gmail_user   = config.get("gmail_user", "").strip()
+        self.app_password = config.get("gmail_app_password", "").replace(" ", "").strip()
+        self.server = None
+
+    def __enter__(self):
+        return self
 
-def send_email_to(config: dict, recipient: str, subject: str, html_body: str) -> bool:
-    gmail_user   = config.get("gmail_user", "").strip()
-    app_password = config.get("gmail_app_password", "").replace(" ", "").strip()
-    if not gmail_user or not app_password or not recipient:
+    def __exit__(self, *exc):
+        self.close()
+
+    def _connect(self):
+        server = smtplib.SMTP_SSL("smtp.gmail.com", 465, timeout=10)
+        try:
+            server.login(self.gmail_user, self.app_password)
+        except Exception:
+            server.close()
+            raise
+        self.server = server
+
+    def sendmail(self, recipient: str, msg: str):
+        for attempt in range(2):
+            if self.server is None:
+                self._connect()
+            try:
+                self.server.sendmail(self.gmail_user, recipient, msg)
+                return
+            except smtplib.SMTPServerDisconnected:
+                self.server = None
+                if attempt:
+                    raise
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except Exception:
+                self.server.close()
+            self.server = None
+
+
+def send_email_to(smtp: SmtpSession, recipient: str, subject: str, body: EmailBody) -> bool:
+    if not smtp.gmail_user or not smtp.app_password or not recipient:
         log("❌ Gmail 미설정 또는 수신자 없음")
         return False
     try:
         msg = MIMEMultipart("alternative")
         msg["Subject"] = subject
-        msg["From"] = f"주식 리서치 <{gmail_user}>"
+        msg["From"] = f"주식 리서치 <{smtp.gmail_user}>"
         msg["To"] = recipient
-        msg.attach(MIMEText(re.sub(r"<[^>]+>", "", html_body), "plain", "utf-8"))
-        msg.attach(MIMEText(html_body, "html", "utf-8"))
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465, timeout=10) as server:
-            server.login(gmail_user, app_password)
-            server.sendmail(gmail_user, recipient, msg.as_string())
+        msg.attach(MIMEText(body.plain, "plain", "utf-8"))
+        msg.attach(MIMEText(body.html, "html", "utf-8"))
+        smtp.sendmail(recipient, msg.as_string())
         log(f"✅ 이메일 전송 → {recipient}")
         return True
     except Exception as e:
@@ -395,10 +757,69 @@ def send_email_to(config: dict, recipient: str, subject: str, html_body: str) ->
         return False
 
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--user-id", default=None, help="단일 유저 ID (지정 시 해당 유저에게만 발송)")
-    args = parser.parse_args()
+NEWS_FALLBACK     = "- 뉴스 요약을 불러오지 못했습니다."
+OVERVIEW_FALLBACK = "- 포트폴리오 요약을 불러오지 못했습니다."
+RISK_FALLBACK     = "- 리스크 정보를 불러오지 못했습니다."
+FOOTER_FALLBACK   = "- 분석을 불러오지 못했습니다."
+
+
+async def safe_call(label: str, coro, fallback):
+    """coro 결과 반환, 실패하면 로그 남기고 fallback 반환"""
+    log(f"{label} 수집 중...")
+    try:
+        result = await coro
+    except Exception as e:
+        log(f"⚠️ {label} 실패: {e}")
+        return fallback
+    log(f"✅ {label} 완료")
+    return result
+
+
+async def portfolio_sections(client, ctx: PortfolioCtx, prefix: str = "") -> tuple:
+    """(포트폴리오 요약, 리스크, 타임프레임) — 실패 시 안내 문구"""
+    return await safe_call(
+        f"{prefix}포트폴리오 요약 · 리스크 · 타임프레임 분석",
+        get_portfolio_bundle(client, ctx),
+        (OVERVIEW_FALLBACK, RISK_FALLBACK, FOOTER_FALLBACK),
+    )
+
+
+async def research_all(client, items: list) -> tuple:
+    """(유형, 대상) 목록을 동시에 리서치하고 ({종목: 내용}, {산업: 내용}) 반환"""
+    stock_reports    = {}
+    industry_reports = {}
+
+    async def research_one(rtype: str, target: str):
+        log(f"리서치: {target}")
+        try:
+            content = await run_research(client, target, rtype)
+            if content:
+                save_report(target, rtype, content)
+                (stock_reports if rtype == "stock" else industry_reports)[target] = content
+                log(f"✅ {target}")
+        except Exception as e:
+            log(f"❌ {target}: {e}")
+
+    await asyncio.gather(*(research_one(rtype, target) for rtype, target in items))
+    return stock_reports, industry_reports
+
+
+def collect_user_reports(stocks: list, industries: list, stock_reports: dict, industry_reports: dict) -> list:
+    """유저 관심 목록 순서대로 리서치 결과를 모아 이메일 카드 목록 생성 (결과 없는 대상은 제외)"""
+    user_reports = []
+    for s in stocks:
+        content = stock_reports.get(s)
+        if content:
+            user_reports.append({"target": s, "type": "stock", "content": content})
+    for i in industries:
+        content = industry_reports.get(i)
+        if content:
+            user_reports.append({"target": i, "type": "industry", "content": content})
+    return user_reports
+
+
+async def run(args):
+    global _gemini_sem, _gemini_rate
 
     log("=" * 50)
     log("📈 자동 실행 시작" + (f" (유저: {args.user_id})" if args.user_id else ""))
@@ -408,99 +829,65 @@ def main():
         log("❌ GEMINI_API_KEY 없음")
         sys.exit(1)
 
-    client    = genai.Client(api_key=api_key)
-    users     = load_users()
-    today_str = datetime.date.today().strftime("%Y년 %m월 %d일")
+    client      = genai.Client(api_key=api_key)
+    _gemini_sem = asyncio.Semaphore(int(config.get("gemini_concurrency", GEMINI_CONCURRENCY)))
+    _gemini_rate = RateLimiter(int(config.get("gemini_rpm", GEMINI_RPM)))
+    users       = load_users()
+    open_llm_cache()
 
-    # ── 단일 유저 모드 ─────────────────────────────────────
-    if args.user_id:
-        target_user = next((u for u in users if u.get("id") == args.user_id), None)
-        if not target_user:
-            log(f"❌ 유저를 찾을 수 없음: {args.user_id}")
-            sys.exit(1)
+    with SmtpSession(config) as smtp:
+        if args.user_id:
+            await run_single_user(client, smtp, users, args.user_id, TODAY_STR)
+        else:
+            await run_all_users(client, smtp, users, TODAY_STR,
+                                int(config.get("user_workers", USER_WORKERS)))
 
-        u_stocks     = target_user.get("stocks", [])
-        u_industries = target_user.get("industries", [])
+    log("📈 완료")
+    log("=" * 50)
 
-        if not u_stocks and not u_industries:
-            log(f"⚠️ {target_user['name']} — 관심 목록 없음, 종료")
-            sys.exit(0)
 
-        # 뉴스
-        log("뉴스 요약 수집 중...")
-        try:
-            news_summary = get_news_summary(client)
-            log("✅ 뉴스 요약 완료")
-        except Exception as e:
-            log(f"⚠️ 뉴스 요약 실패: {e}")
-            news_summary = "- 뉴스 요약을 불러오지 못했습니다."
-
-        # 개별 종목/산업 리서치
-        items = [("stock", s) for s in u_stocks] + [("industry", i) for i in u_industries]
-        report_map = {}
-        for rtype, target in items:
-            log(f"리서치: {target}")
-            try:
-                content = run_research(client, target, rtype)
-                if content:
-                    save_report(target, rtype, content)
-                    report_map[(rtype, target)] = content
-                    log(f"✅ {target}")
-            except Exception as e:
-                log(f"❌ {target}: {e}")
-
-        if not report_map:
-            log("리서치 결과 없음 — 종료")
-            sys.exit(0)
-
-        # 포트폴리오 요약
-        log("포트폴리오 요약 수집 중...")
-        try:
-            portfolio_overview = get_portfolio_overview(client, u_stocks, u_industries)
-            log("✅ 포트폴리오 요약 완료")
-        except Exception as e:
-            log(f"⚠️ 포트폴리오 요약 실패: {e}")
-            portfolio_overview = "- 포트폴리오 요약을 불러오지 못했습니다."
+async def run_single_user(client, smtp: SmtpSession, users: list, user_id: str, today_str: str):
+    """단일 유저 모드 — 해당 유저에게만 발송"""
+    target_user = next((u for u in users if u.get("id") == user_id), None)
+    if not target_user:
+        log(f"❌ 유저를 찾을 수 없음: {user_id}")
+        sys.exit(1)
 
-        # 포트폴리오 리스크
-        log("포트폴리오 리스크 수집 중...")
-        try:
-            portfolio_risk = get_portfolio_risk(client, u_stocks, u_industries)
-            log("✅ 포트폴리오 리스크 완료")
-        except Exception as e:
-            log(f"⚠️ 포트폴리오 리스크 실패: {e}")
-            portfolio_risk = "- 리스크 정보를 불러오지 못했습니다."
+    u_stocks     = target_user.get("stocks", [])
+    u_industries = target_user.get("industries", [])
 
-        # 타임프레임
-        log("타임프레임 분석 수집 중...")
-        try:
-            report_footer = get_report_footer(client, u_stocks, u_industries)
-            log("✅ 타임프레임 분석 완료")
-        except Exception as e:
-            log(f"⚠️ 타임프레임 분석 실패: {e}")
-            report_footer = "- 분석을 불러오지 못했습니다."
-
-        user_reports = []
-        for s in u_stocks:
-            if ("stock", s) in report_map:
-                user_reports.append({"target": s, "type": "stock", "content": report_map[("stock", s)]})
-        for i in u_industries:
-            if ("industry", i) in report_map:
-                user_reports.append({"target": i, "type": "industry", "content": report_map[("industry", i)]})
-
-        if user_reports:
-            subject = f"📈 {target_user['name']}님의 [{today_str}] 리서치 ({len(user_reports)}건)"
-            send_email_to(config, target_user["email"], subject,
-                          build_html_email(user_reports, news_summary, portfolio_overview,
-                                           portfolio_risk, report_footer))
-        else:
-            log(f"⚠️ {target_user['name']} — 해당 종목 결과 없음")
+    if not u_stocks and not u_industries:
+        log(f"⚠️ {target_user['name']} — 관심 목록 없음, 종료")
+        sys.exit(0)
+
+    # 개별 종목/산업 리서치 (동시 실행)
+    items = [("stock", s) for s in u_stocks] + [("industry", i) for i in u_industries]
+    stock_reports, industry_reports = await research_all(client, items)
+
+    if not stock_reports and not industry_reports:
+        log("리서치 결과 없음 — 종료")
+        sys.exit(0)
+
+    # 뉴스 / 포트폴리오 요약 / 리스크 / 타임프레임 (동시 실행)
+    news_summary, (portfolio_overview, portfolio_risk, report_footer) = await asyncio.gather(
+        safe_call("뉴스 요약", get_news_summary(client), NEWS_FALLBACK),
+        portfolio_sections(client, portfolio_ctx(u_stocks, u_industries)),
+    )
+
+    user_reports = collect_user_reports(u_stocks, u_industries, stock_reports, industry_reports)
+
+    if user_reports:
+        subject = f"📈 {target_user['name']}님의 [{today_str}] 리서치 ({len(user_reports)}건)"
+        send_email_to(smtp, target_user["email"], subject,
+                      build_html_email(user_reports, news_summary, portfolio_overview,
+                                       portfolio_risk, report_footer))
+    else:
+        log(f"⚠️ {target_user['name']} — 해당 종목 결과 없음")
 
-        log("📈 완료")
-        log("=" * 50)
-        return
 
-    # ── 전체 발송 모드 ─────────────────────────────────────
+async def run_all_users(client, smtp: SmtpSession, users: list, today_str: str,
+                        workers: int = USER_WORKERS):
+    """전체 발송 모드 — 활성 구독자 전체에게 맞춤 발송"""
     active_users = [u for u in users if u.get("active", True)]
 
     # 1. 활성 구독자의 고유 종목/산업 수집
@@ -514,77 +901,65 @@ def main():
         log("⚠️  관심 목록 없음 — 종료")
         sys.exit(0)
 
-    # 2. 뉴스 요약 (공통 1회)
-    log("뉴스 요약 수집 중...")
-    try:
-        news_summary = get_news_summary(client)
-        log("✅ 뉴스 요약 완료")
-    except Exception as e:
-        log(f"⚠️ 뉴스 요약 실패: {e}")
-        news_summary = "- 뉴스 요약을 불러오지 못했습니다."
-
-    # 3. 고유 종목/산업 1회씩 리서치
+    # 2~3. 뉴스 요약(공통 1회)과 고유 종목/산업 리서치를 동시에 실행
     items = [("stock", s) for s in all_stocks] + [("industry", i) for i in all_industries]
-    report_map = {}
-    for rtype, target in items:
-        log(f"리서치: {target}")
-        try:
-            content = run_research(client, target, rtype)
-            if content:
-                save_report(target, rtype, content)
-                report_map[(rtype, target)] = content
-                log(f"✅ {target}")
-        except Exception as e:
-            log(f"❌ {target}: {e}")
+    news_summary, (stock_reports, industry_reports) = await asyncio.gather(
+        safe_call("뉴스 요약", get_news_summary(client), NEWS_FALLBACK),
+        research_all(client, items),
+    )
 
-    if not report_map:
+    if not stock_reports and not industry_reports:
         log("리서치 결과 없음 — 종료")
         sys.exit(0)
 
-    # 4. 구독자별 맞춤 이메일 발송
+    # 4. 구독자별 맞춤 이메일 — 워커 여러 개가 유저 큐에서 꺼내 본문을 만들고,
+    #    발송 태스크 하나가 메일 큐를 비우며 같은 SMTP 연결로 차례로 전송
+    user_q: asyncio.Queue = asyncio.Queue()
+    mail_q: asyncio.Queue = asyncio.Queue()
     for u in active_users:
-        u_stocks     = u.get("stocks", [])
-        u_industries = u.get("industries", [])
-
-        user_reports = []
-        for s in u_stocks:
-            if ("stock", s) in report_map:
-                user_reports.append({"target": s, "type": "stock", "content": report_map[("stock", s)]})
-        for i in u_industries:
-            if ("industry", i) in report_map:
-                user_reports.append({"target": i, "type": "industry", "content": report_map[("industry", i)]})
-        if not user_reports:
-            log(f"⚠️ {u['name']} — 해당 종목 결과 없음, 건너뜀")
-            continue
-
-        log(f"{u['name']} 포트폴리오 요약 수집 중...")
-        try:
-            portfolio_overview = get_portfolio_overview(client, u_stocks, u_industries)
-        except Exception as e:
-            log(f"⚠️ 포트폴리오 요약 실패: {e}")
-            portfolio_overview = "- 포트폴리오 요약을 불러오지 못했습니다."
+        user_q.put_nowait(u)
 
-        log(f"{u['name']} 포트폴리오 리스크 수집 중...")
-        try:
-            portfolio_risk = get_portfolio_risk(client, u_stocks, u_industries)
-        except Exception as e:
-            log(f"⚠️ 포트폴리오 리스크 실패: {e}")
-            portfolio_risk = "- 리스크 정보를 불러오지 못했습니다."
+    async def compose_worker():
+        while not user_q.empty():
+            u = user_q.get_nowait()
+            u_stocks     = u.get("stocks", [])
+            u_industries = u.get("industries", [])
 
-        log(f"{u['name']} 타임프레임 분석 수집 중...")
-        try:
-            report_footer = get_report_footer(client, u_stocks, u_industries)
-        except Exception as e:
-            log(f"⚠️ 타임프레임 분석 실패: {e}")
-            report_footer = "- 분석을 불러오지 못했습니다."
+            user_reports = collect_user_reports(u_stocks, u_industries, stock_reports, industry_reports)
+            if not user_reports:
+                log(f"⚠️ {u['name']} — 해당 종목 결과 없음, 건너뜀")
+                continue
 
-        subject = f"📈 {u['name']}님의 [{today_str}] 리서치 ({len(user_reports)}건)"
-        send_email_to(config, u["email"], subject,
-                      build_html_email(user_reports, news_summary, portfolio_overview,
-                                       portfolio_risk, report_footer))
+            portfolio_overview, portfolio_risk, report_footer = await portfolio_sections(
+                client, portfolio_ctx(u_stocks, u_industries), prefix=f"{u['name']} "
+            )
 
-    log("📈 완료")
-    log("=" * 50)
+            subject = f"📈 {u['name']}님의 [{today_str}] 리서치 ({len(user_reports)}건)"
+            await mail_q.put((u["email"], subject,
+                              build_html_email(user_reports, news_summary, portfolio_overview,
+                                               portfolio_risk, report_footer)))
+
+    async def sender():
+        # None이 들어오면 종료 — SMTP 호출은 블로킹이라 스레드에서 실행
+        while (mail := await mail_q.get()) is not None:
+            await asyncio.to_thread(send_email_to, smtp, *mail)
+
+    send_task = asyncio.create_task(sender())
+    try:
+        await asyncio.gather(*(compose_worker() for _ in range(max(workers, 1))))
+    finally:
+        await mail_q.put(None)
+        await send_task
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--user-id", default=None, help="단일 유저 ID (지정 시 해당 유저에게만 발송)")
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args))
+    finally:
+        close_llm_cache()
 
 
 if __name__ == "__main__":